@@ -1,10 +1,32 @@
 from django.contrib.auth.models import User, Group
+from django.db import models
+from django.db.models import OuterRef, Subquery
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from snippets.models import Snippet
-from snippets.serializers import SnippetSerializer
+from snippets.serializers import DynamicFieldsMixin, SnippetSerializer
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+class FirstPageListSerializer(serializers.ListSerializer):
+    # Only the first page of the list, the same one /users/<pk>/snippets/ starts with.
+    def limit_prefetch(self, queryset, parent_field):
+        # Called by optimize_queryset(), so the prefetch loads at most a page per parent instead of every related
+        # row. /users/ isn't paginated, but this keeps ?expand=snippets to PAGE_SIZE snippets per user listed.
+        first_page = queryset.model._default_manager.filter(
+            **{parent_field: OuterRef(parent_field)}).values('pk')[:api_settings.PAGE_SIZE]
+        return queryset.filter(pk__in=Subquery(first_page))
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return super(FirstPageListSerializer, self).to_representation(iterable[:api_settings.PAGE_SIZE])
+
+
+class UserSnippetSerializer(SnippetSerializer):
+    class Meta(SnippetSerializer.Meta):
+        list_serializer_class = FirstPageListSerializer
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     ### Many different types of representation available ###
     # When queryset argument isn't presented the UserSerializer is looking to find 'related_name' somewere
     # in the models. In this case the Snippet model is containing an owner ForeignKey pointing to 'auth.User'
@@ -17,17 +39,27 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     # HyperlinkedRelatedField may be used to represent the target of the relationship using a hyperlink.
     # The HyperlinkedRelatedField and the HyperlinkedModelSerializer both require 'view_name'. It needs to be
     # detail view so it can get the object properties.
-    snippets = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name='snippet-detail')
+    #snippets = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name='snippet-detail')
+    # The list above grows with every snippet the user writes, so we link to the paginated /users/<pk>/snippets/
+    # sub-resource instead and show the denormalized counters kept in SnippetStats.
+    snippets = serializers.HyperlinkedIdentityField(view_name='user-snippets')
+    snippet_count = serializers.IntegerField(source='snippet_stats.snippet_count', read_only=True)
+    last_snippet_at = serializers.DateTimeField(source='snippet_stats.last_snippet_at', read_only=True)
     # SlugRelatedField may be used to represent the target of the relationship using a field on the target.
     #snippets = serializers.SlugRelatedField(many=True, read_only=True, slug_field='title')
     # Nested relationships can be expressed by using serializers as fields.
     #snippets = SnippetSerializer(many=True, read_only=True)
     class Meta:
         model = User
-        fields = ('url', 'id', 'username', 'email', 'groups', 'snippets')
+        fields = ('url', 'id', 'username', 'email', 'groups', 'snippets', 'snippet_count', 'last_snippet_at')
+        # ?expand=snippets embeds the first page of the user's snippets instead of the link, snippet_count tells
+        # whether there are more.
+        expandable_fields = {
+            'snippets': (UserSnippetSerializer, {'many': True, 'read_only': True}),
+        }
 
 
-class GroupSerializer(serializers.HyperlinkedModelSerializer):
+class GroupSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Group
         fields = ('url', 'name')
\ No newline at end of file
@@ -2,19 +2,38 @@
 
 
 from django.contrib.auth.models import User, Group
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from quickstart.serializers import UserSerializer, GroupSerializer
+from snippets.models import Snippet
+from snippets.serializers import SnippetSerializer
+from snippets.throttling import UserThrottle
+from snippets.views import SparseFieldsetsMixin
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsetsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
+    throttle_classes = (UserThrottle,)
 
+    # /users/<pk>/snippets/ - the user's snippets, a page at a time.
+    @action(detail=True, serializer_class=SnippetSerializer, pagination_class=PageNumberPagination)
+    def snippets(self, request, pk=None, **kwargs):
+        user = get_object_or_404(User.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, user)
+        # Not user.snippets.all(), the related manager reads owner_id of every row even when it's deferred.
+        queryset = self.get_serializer().optimize_queryset(Snippet.objects.filter(owner_id=user.pk))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-class GroupViewSet(viewsets.ModelViewSet):
+
+class GroupViewSet(SparseFieldsetsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
@@ -1,5 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class SnippetsConfig(AppConfig):
     name = 'snippets'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from tutorial.db import configure_sqlite
+        from snippets import signals
+        connection_created.connect(configure_sqlite, dispatch_uid='tutorial.db.configure_sqlite')
+        post_save.connect(signals.create_snippet_stats, sender=User, dispatch_uid='snippets.create_snippet_stats')
+        post_save.connect(signals.snippet_created, sender='snippets.Snippet', dispatch_uid='snippets.snippet_created')
+        post_delete.connect(signals.snippet_deleted, sender='snippets.Snippet', dispatch_uid='snippets.snippet_deleted')
+        post_save.connect(signals.log_snippet_saved, sender='snippets.Snippet', dispatch_uid='snippets.log_snippet_saved')
+        post_delete.connect(signals.log_snippet_deleted, sender='snippets.Snippet',
+                            dispatch_uid='snippets.log_snippet_deleted')
+        pre_delete.connect(signals.remember_snippet_content, sender='snippets.Snippet',
+                           dispatch_uid='snippets.remember_snippet_content')
+        post_delete.connect(signals.release_snippet_content, sender='snippets.Snippet',
+                            dispatch_uid='snippets.release_snippet_content')
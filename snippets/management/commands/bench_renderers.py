@@ -0,0 +1,59 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from snippets.parsers import ColumnarJSONParser, MessagePackParser
+from snippets.renderers import ColumnarJSONRenderer, MessagePackRenderer, msgpack
+
+
+def snippet_list(count):
+    # Shaped like a SnippetList response.
+    return [
+        {
+            'url': 'http://127.0.0.1:8000/snippets/%d/' % i,
+            'id': i,
+            'highlight': 'http://127.0.0.1:8000/snippets/%d/highlight/' % i,
+            'owner': 'user%d' % (i % 10),
+            'title': 'Snippet %d' % i,
+            'code': 'def f%d(x):\n    return x * %d\n' % (i, i),
+            'linenos': bool(i % 2),
+            'language': 'python',
+            'style': 'friendly',
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare size and speed of the JSON, columnar JSON and MessagePack renderers on a list of snippets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snippets', type=int, default=1000, help='Snippets in the rendered list.')
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = snippet_list(options['snippets'])
+        rounds = options['rounds']
+        formats = [
+            ('json', JSONRenderer(), JSONParser()),
+            ('columnar', ColumnarJSONRenderer(), ColumnarJSONParser()),
+        ]
+        if msgpack is not None:
+            formats.append(('msgpack', MessagePackRenderer(), MessagePackParser()))
+        else:
+            self.stdout.write('msgpack is not installed, skipping MessagePack.')
+
+        self.stdout.write('%-10s %10s %12s %12s' % ('format', 'bytes', 'render ms', 'parse ms'))
+        for name, renderer, parser in formats:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                content = renderer.render(data)
+            render_ms = (time.perf_counter() - start) / rounds * 1000
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parser.parse(io.BytesIO(content))
+            parse_ms = (time.perf_counter() - start) / rounds * 1000
+            self.stdout.write('%-10s %10d %12.2f %12.2f' % (name, len(content), render_ms, parse_ms))
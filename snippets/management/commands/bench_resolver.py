@@ -0,0 +1,94 @@
+import time
+
+from django.conf.urls import include, url
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+from rest_framework.urlpatterns import format_suffix_patterns
+
+HOT_PATHS = ['/snippets/', '/snippets/12/', '/snippets/12/highlight/', '/snippets.json']
+
+
+def view(request, *args, **kwargs):
+    pass
+
+
+def resource_patterns(name, prefixed):
+    # Detail routes of a resource with format suffixes like a router generates them, the list route and its
+    # suffix version come from resource_list_patterns().
+    start = '^' if prefixed else '^%s/' % name
+    return format_suffix_patterns([
+        url(r'%s(?P<pk>[0-9]+)/$' % start, view, name='%s-detail' % name),
+        url(r'%s(?P<pk>[0-9]+)/edit/$' % start, view, name='%s-edit' % name),
+    ])
+
+
+def resource_list_patterns(name):
+    return format_suffix_patterns([url(r'^%s/$' % name, view, name='%s-list' % name)])
+
+
+def snippet_patterns(prefixed):
+    # Everything below /snippets/, the list route itself stays at the top level.
+    start = '^' if prefixed else '^snippets/'
+    return format_suffix_patterns([
+        url(r'%s(?P<pk>[0-9]+)/$' % start, view, name='snippet-detail'),
+        url(r'%s(?P<pk>[0-9]+)/highlight/$' % start, view, name='snippet-highlight'),
+        url(r'%schanges/$' % start, view, name='snippet-changes'),
+    ])
+
+
+def snippet_list_patterns():
+    return format_suffix_patterns([url(r'^snippets/$', view, name='snippet-list')])
+
+
+def flat_urlconf(resources):
+    # The old layout: every pattern at the top level, snippets after everything the router added.
+    patterns = []
+    for i in range(resources):
+        patterns += resource_list_patterns('resource%d' % i) + resource_patterns('resource%d' % i, False)
+    patterns += snippet_list_patterns() + snippet_patterns(False)
+    return type('FlatURLConf', (), {'urlpatterns': patterns})
+
+
+def prefixed_urlconf(resources, hot_first):
+    # Per resource the list routes plus one prefix pattern for everything below it, so the resolver tries three
+    # regexes per resource instead of one per route.
+    patterns = []
+    for i in range(resources):
+        name = 'resource%d' % i
+        patterns += resource_list_patterns(name) + [url(r'^%s/' % name, include(resource_patterns(name, True)))]
+    snippets = snippet_list_patterns() + [url(r'^snippets/', include(snippet_patterns(True)))]
+    if hot_first:
+        patterns = snippets + patterns
+    else:
+        patterns += snippets
+    return type('PrefixedURLConf', (), {'urlpatterns': patterns})
+
+
+class Command(BaseCommand):
+    help = ('Compare how long resolving the snippet routes takes with flat URL patterns and with prefix groups '
+            'as the number of other routes grows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=2000, help='Resolves of every hot path per measurement.')
+
+    def measure(self, urlconf, rounds):
+        resolver = get_resolver(urlconf)
+        for path in HOT_PATHS:
+            resolver.resolve(path)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for path in HOT_PATHS:
+                resolver.resolve(path)
+        return (time.perf_counter() - start) / (rounds * len(HOT_PATHS)) * 1e6
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        self.stdout.write('Microseconds per resolve of a snippet route:')
+        self.stdout.write('%10s %10s %10s %12s' % ('resources', 'flat', 'prefixed', 'hot first'))
+        for resources in (2, 10, 50, 200):
+            self.stdout.write('%10d %10.1f %10.1f %12.1f' % (
+                resources,
+                self.measure(flat_urlconf(resources), rounds),
+                self.measure(prefixed_urlconf(resources, False), rounds),
+                self.measure(prefixed_urlconf(resources, True), rounds),
+            ))
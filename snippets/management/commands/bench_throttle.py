@@ -0,0 +1,59 @@
+import pickle
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import AnonRateThrottle
+
+from snippets.throttling import TokenBucketThrottle
+
+
+# Rates high enough that no request of the benchmark is rejected, we measure the bookkeeping only.
+class BenchTokenBucketThrottle(TokenBucketThrottle):
+    rate = '1000000/hour'
+
+
+class BenchHistoryThrottle(AnonRateThrottle):
+    rate = '1000000/hour'
+
+
+class Command(BaseCommand):
+    help = ('Measure the per request overhead and the cache entry size of the token bucket throttle against '
+            'REST framework\'s request history throttle, with the in-process and the file based cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per measurement.')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/snippets/'))
+        request.user = AnonymousUser()
+        n = options['requests']
+
+        directory = tempfile.mkdtemp()
+        stores = [
+            ('locmem', LocMemCache('bench', {})),
+            ('file', FileBasedCache(directory, {})),
+        ]
+        self.stdout.write('%-8s %-14s %12s %14s' % ('cache', 'throttle', 'us/request', 'entry bytes'))
+        try:
+            for store_name, cache in stores:
+                for throttle_name, throttle_class in (('token-bucket', BenchTokenBucketThrottle),
+                                                      ('history', BenchHistoryThrottle)):
+                    cache.clear()
+                    throttle = throttle_class()
+                    throttle.cache = cache
+                    start = time.perf_counter()
+                    for _ in range(n):
+                        throttle.allow_request(request, None)
+                    elapsed = time.perf_counter() - start
+                    entry = cache.get(throttle.key)
+                    self.stdout.write('%-8s %-14s %12.1f %14d' % (
+                        store_name, throttle_name, elapsed / n * 1e6, len(pickle.dumps(entry))))
+        finally:
+            shutil.rmtree(directory)
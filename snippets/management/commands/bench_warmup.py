@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+
+def memory_kb():
+    # Rss counts the pages a worker shares with the master too, Private only the ones it has of its own.
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0])
+    except IOError:
+        return None, None
+    return usage['Rss'], usage['Private_Clean'] + usage['Private_Dirty']
+
+
+class Command(BaseCommand):
+    help = ('Measure the first request latency and the memory of a freshly forked worker, with and without '
+            'tutorial.preload having run in the master before the fork. Memory figures need Linux.')
+    # The checks import the URLconf and with it every view, the cold worker wouldn't be cold anymore.
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snippet', type=int, default=1, help='Snippet used for the detail and highlight paths.')
+        parser.add_argument('--user', help='Staff user the requests are made as, the first superuser by default.')
+        parser.add_argument('--worker', choices=['cold', 'preload'], help='Internal, measures one master and worker.')
+
+    def paths(self, snippet):
+        return ['/', '/snippets/', '/snippets/%d/' % snippet, '/snippets/%d/highlight/' % snippet,
+                '/snippets/changes/', '/users/']
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.worker(options)
+
+        users = User.objects.filter(is_staff=True).order_by('-is_superuser', 'pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No staff user to make the requests as.')
+
+        results = {}
+        for mode in ('cold', 'preload'):
+            output = subprocess.check_output([
+                sys.executable, sys.argv[0], 'bench_warmup', '--worker', mode,
+                '--snippet', str(options['snippet']), '--user', user.username,
+            ])
+            results[mode] = json.loads(output.decode().strip().splitlines()[-1])
+
+        cold, warm = results['cold'], results['preload']
+        self.stdout.write('%-28s %10s %10s' % ('first request ms', 'cold', 'preload'))
+        for path in self.paths(options['snippet']):
+            self.stdout.write('%-28s %10.1f %10.1f' % (path, cold['first'][path], warm['first'][path]))
+        self.stdout.write('%-28s %10.1f %10.1f' % ('total', sum(cold['first'].values()), sum(warm['first'].values())))
+        self.stdout.write('%-28s %10.1f %10.1f' % (
+            'same paths again, total', sum(cold['again'].values()), sum(warm['again'].values())))
+        self.stdout.write('%-28s %10.1f %10.1f' % ('preload in master ms', 0, warm['preload_ms']))
+        if cold['worker_rss'] is not None:
+            self.stdout.write('%-28s %10d %10d' % ('master RSS KB', cold['master_rss'], warm['master_rss']))
+            self.stdout.write('%-28s %10d %10d' % ('worker RSS KB', cold['worker_rss'], warm['worker_rss']))
+            self.stdout.write('%-28s %10d %10d' % (
+                'worker private KB', cold['worker_private'], warm['worker_private']))
+
+    def worker(self, options):
+        preload_ms = 0
+        if options['worker'] == 'preload':
+            from tutorial.preload import preload
+            start = time.perf_counter()
+            preload()
+            preload_ms = (time.perf_counter() - start) * 1000
+        master_rss, _ = memory_kb()
+
+        # Fork like gunicorn does and let the child serve its first requests.
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            # With DEBUG and no ALLOWED_HOSTS Django accepts localhost.
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(User.objects.get(username=options['user']))
+            first, again = {}, {}
+            for timings in (first, again):
+                for path in self.paths(options['snippet']):
+                    start = time.perf_counter()
+                    client.get(path)
+                    timings[path] = (time.perf_counter() - start) * 1000
+            worker_rss, worker_private = memory_kb()
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump({'first': first, 'again': again, 'worker_rss': worker_rss,
+                           'worker_private': worker_private}, f)
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            result = json.load(f)
+        os.waitpid(pid, 0)
+        result.update(preload_ms=preload_ms, master_rss=master_rss)
+        self.stdout.write(json.dumps(result))
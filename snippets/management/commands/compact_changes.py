@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from snippets.models import SnippetChange, SnippetChangeHorizon
+from tutorial.db import pin_to_primary
+
+
+class Command(BaseCommand):
+    help = ('Compact the snippet change log. Entries older than --days are dropped when a newer entry for the same '
+            'snippet exists, and so are old `deleted` entries. Consumers that are behind the dropped `deleted` '
+            'entries are told to resync by the feed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Keep every entry younger than this.')
+
+    def handle(self, *args, **options):
+        # The horizon must come from the primary, a lagging replica would miss the newest dropped entries.
+        pin_to_primary()
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = SnippetChange.objects.filter(created__lt=cutoff)
+
+        with transaction.atomic():
+            # A consumer reading past a superseded entry still gets the newer one, so these are safe to drop.
+            newer = SnippetChange.objects.filter(snippet_id=OuterRef('snippet_id'), seq__gt=OuterRef('seq'))
+            superseded = old.annotate(superseded=Exists(newer)).filter(superseded=True).values('seq')
+            superseded_count, _ = SnippetChange.objects.filter(seq__in=superseded).delete()
+
+            # Consumers that haven't synced since the cutoff miss these, the horizon makes the feed tell them to
+            # resync completely.
+            tombstones = old.filter(action=SnippetChange.DELETED)
+            horizon = tombstones.aggregate(seq=Max('seq'))['seq']
+            tombstone_count, _ = tombstones.delete()
+            if horizon is not None:
+                SnippetChangeHorizon.advance(horizon)
+
+        self.stdout.write('Removed %d superseded and %d deleted entries.' % (superseded_count, tombstone_count))
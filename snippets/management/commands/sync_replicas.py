@@ -0,0 +1,29 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the local stand-in replicas listed in DATABASE_REPLICAS.'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('sync_replicas only works with SQLite, real replicas are fed by the database server.')
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write('No replicas configured, set TUTORIAL_DB_REPLICAS.')
+            return
+
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            # Close our own connection first so the backup doesn't fight with an open reader.
+            connections[alias].close()
+            target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                # The online backup API gives a consistent copy even while the primary is in use.
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write('Synced %s' % alias)
@@ -0,0 +1,18 @@
+from django.core.cache import cache
+from rest_framework.metadata import SimpleMetadata
+
+
+class CachedMetadata(SimpleMetadata):
+    # OPTIONS responses describe every field of the view's serializer, including the hundreds of Pygments
+    # language choices. The description only depends on the serializer class (OPTIONS builds it for a PUT/POST,
+    # so ?fields= and friends don't apply), so it's built once per class. Permissions are still checked on
+    # every request by determine_actions().
+    def get_serializer_info(self, serializer):
+        if hasattr(serializer, 'child'):
+            serializer = serializer.child
+        key = 'metadata:%s.%s' % (serializer.__class__.__module__, serializer.__class__.__name__)
+        info = cache.get(key)
+        if info is None:
+            info = super(CachedMetadata, self).get_serializer_info(serializer)
+            cache.set(key, info, None)
+        return info
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def populate_snippet_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Snippet = apps.get_model('snippets', 'Snippet')
+    SnippetStats = apps.get_model('snippets', 'SnippetStats')
+    db = schema_editor.connection.alias
+
+    totals = dict(
+        (row['owner'], row)
+        for row in Snippet.objects.using(db).order_by().values('owner').annotate(
+            count=Count('pk'), last=Max('created'))
+    )
+    SnippetStats.objects.using(db).bulk_create([
+        SnippetStats(
+            user_id=user_id,
+            snippet_count=totals.get(user_id, {}).get('count', 0),
+            last_snippet_at=totals.get(user_id, {}).get('last'),
+        )
+        for user_id in User.objects.using(db).values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('snippets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snippet_count', models.PositiveIntegerField(default=0)),
+                ('last_snippet_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snippet_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(populate_snippet_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0002_snippetstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('snippet_id', models.IntegerField(db_index=True)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=7)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ('seq',),
+            },
+        ),
+    ]
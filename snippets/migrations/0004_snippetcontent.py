@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of snippets.models.content_digest.
+def content_digest(code, language, style, linenos, title):
+    key = '\0'.join([language, style, linenos and '1' or '0', title, code])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def dedup_snippets(apps, schema_editor):
+    # Move code and highlighted HTML into one SnippetContent row per distinct content. The HTML rendered when
+    # the snippets were saved is reused, nothing is highlighted again.
+    Snippet = apps.get_model('snippets', 'Snippet')
+    SnippetContent = apps.get_model('snippets', 'SnippetContent')
+    db = schema_editor.connection.alias
+
+    contents = {}
+    for snippet in Snippet.objects.using(db).order_by('pk').iterator():
+        digest = content_digest(snippet.code, snippet.language, snippet.style, snippet.linenos, snippet.title)
+        if digest not in contents:
+            contents[digest] = SnippetContent(digest=digest, code=snippet.code, highlighted=snippet.highlighted)
+        contents[digest].ref_count += 1
+        Snippet.objects.using(db).filter(pk=snippet.pk).update(content=digest)
+    SnippetContent.objects.using(db).bulk_create(contents.values())
+
+
+def restore_snippets(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    db = schema_editor.connection.alias
+    for snippet in Snippet.objects.using(db).select_related('content').iterator():
+        Snippet.objects.using(db).filter(pk=snippet.pk).update(
+            code=snippet.content.code, highlighted=snippet.content.highlighted)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0003_snippetchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetContent',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('code', models.TextField()),
+                ('highlighted', models.TextField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='content',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='snippets.SnippetContent'),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='code',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='highlighted',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(dedup_snippets, restore_snippets),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='code',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='highlighted',
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='content',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='snippets.SnippetContent'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+import hashlib
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+from django.db.models import F
 from pygments.lexers import get_all_lexers
 from pygments.styles import get_all_styles
 
@@ -11,31 +14,184 @@ LANGUAGE_CHOICES = sorted([(item[1][0], item[0]) for item in LEXERS])
 STYLE_CHOICES = sorted((item, item) for item in get_all_styles())
 
 
+def content_digest(code, language, style, linenos, title):
+    """
+    Hash of everything that goes into the highlighted HTML. The title and
+    linenos are part of it because the formatter renders them too.
+    """
+    key = '\0'.join([language, style, linenos and '1' or '0', title, code])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class SnippetContent(models.Model):
+    # Content addressed store of the code and its highlighted HTML. Identical pastes share one row, so storage
+    # and Pygments work grow with the unique contents and not with the number of snippets.
+    # `ref_count` is the number of snippets pointing at the row, the last one to let go deletes it.
+    digest = models.CharField(max_length=64, primary_key=True)
+    code = models.TextField()
+    highlighted = models.TextField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def acquire(cls, code, language, style, linenos, title):
+        """
+        Return the content row for these inputs with its reference taken,
+        highlighting the code only when no snippet had it before.
+        """
+        digest = content_digest(code, language, style, linenos, title)
+        # Always the primary. A replica may still have a row the primary has deleted, or not have one yet.
+        objects = cls.objects.db_manager(DEFAULT_DB_ALIAS)
+        highlighted = None
+        while True:
+            # Taking the reference first means a concurrent release() can't delete the row under us.
+            if objects.filter(pk=digest).update(ref_count=F('ref_count') + 1):
+                return objects.get(pk=digest)
+            if highlighted is None:
+                lexer = get_lexer_by_name(language)
+                linenos = linenos and 'table' or False
+                options = title and {'title': title} or {}
+                formatter = HtmlFormatter(style=style, linenos=linenos,
+                                          full=True, **options)
+                highlighted = highlight(code, lexer, formatter)
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    return objects.create(digest=digest, code=code, highlighted=highlighted, ref_count=1)
+            except IntegrityError:
+                # Somebody else stored the same content in the meantime, take a reference to theirs.
+                pass
+
+    @classmethod
+    def release(cls, digest):
+        objects = cls.objects.db_manager(DEFAULT_DB_ALIAS)
+        # The row stays locked from the update to the delete, so an acquire() in between can't be lost.
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            objects.filter(pk=digest).update(ref_count=F('ref_count') - 1)
+            objects.filter(pk=digest, ref_count=0).delete()
+
+    def __str__(self):
+        return self.digest
+
+
 class Snippet(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=100, blank=True, default='')
-    code = models.TextField()
     linenos = models.BooleanField(default=False)
     language = models.CharField(choices=LANGUAGE_CHOICES, default='python', max_length=100)
     style = models.CharField(choices=STYLE_CHOICES, default='friendly', max_length=100)
     owner = models.ForeignKey('auth.User', related_name='snippets', on_delete=models.CASCADE)
-    highlighted = models.TextField()
+    content = models.ForeignKey(SnippetContent, related_name='snippets', on_delete=models.PROTECT)
+
+    # Code assigned since the snippet was loaded, it's moved into `content` by save().
+    _code = None
+
+    @property
+    def code(self):
+        if self._code is not None:
+            return self._code
+        if self.content_id is None:
+            return ''
+        return self.content.code
+
+    @code.setter
+    def code(self, value):
+        self._code = value
+
+    @property
+    def highlighted(self):
+        return self.content.highlighted
+
+    def current_content_id(self):
+        # Locks the snippet's row until the end of the transaction, so no other write moves its content meanwhile.
+        if self.pk is None:
+            return None
+        return Snippet.objects.db_manager(DEFAULT_DB_ALIAS).select_for_update().filter(pk=self.pk).values_list(
+            'content_id', flat=True).first()
 
     def save(self, *args, **kwargs):
         """
-        Use the `pygments` library to create a highlighted HTML
-        representation of the code snippet.
+        Point the snippet at the SnippetContent for its code and options,
+        which holds the `pygments` highlighted HTML representation.
         """
-        lexer = get_lexer_by_name(self.language)
-        linenos = self.linenos and 'table' or False
-        options = self.title and {'title': self.title} or {}
-        formatter = HtmlFormatter(style=self.style, linenos=linenos,
-                                  full=True, **options)
-        self.highlighted = highlight(self.code, lexer, formatter)
-        super(Snippet, self).save(*args, **kwargs)
+        digest = content_digest(self.code, self.language, self.style, self.linenos, self.title)
+        # The owner's SnippetStats are updated by a post_save receiver, keep all the writes in one transaction.
+        with transaction.atomic():
+            # The reference to give up is the one the primary has now. This instance may come from a replica or
+            # an old fetch and carry a content_id that has been replaced since.
+            previous = self.current_content_id()
+            if digest != previous:
+                self.content = SnippetContent.acquire(self.code, self.language, self.style, self.linenos,
+                                                      self.title)
+            elif self.content_id != previous:
+                self.content = SnippetContent.objects.db_manager(DEFAULT_DB_ALIAS).get(pk=previous)
+            super(Snippet, self).save(*args, **kwargs)
+            if previous is not None and digest != previous:
+                SnippetContent.release(previous)
+        self._code = None
 
     class Meta:
         ordering = ('created',)
 
     def __str__(self):
         return self.title
+
+
+class SnippetStats(models.Model):
+    # Denormalized per user counters, so listing users doesn't have to count or list their snippets.
+    # Kept up to date by the receivers in snippets/signals.py, `python manage.py recount_snippets` rebuilds them.
+    user = models.OneToOneField('auth.User', related_name='snippet_stats', on_delete=models.CASCADE)
+    snippet_count = models.PositiveIntegerField(default=0)
+    last_snippet_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s: %d snippets' % (self.user_id, self.snippet_count)
+
+
+class SnippetChange(models.Model):
+    # Append-only log of snippet writes, served by the /snippets/changes/ feed. `seq` is the sync token, a
+    # consumer asks for everything after the last seq it has seen. There's no foreign key to Snippet so the
+    # `deleted` entries outlive their snippet. Written by the receivers in snippets/signals.py.
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Deleted'),
+    )
+
+    seq = models.BigAutoField(primary_key=True)
+    snippet_id = models.IntegerField(db_index=True)
+    action = models.CharField(choices=ACTION_CHOICES, max_length=7)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ('seq',)
+
+    @classmethod
+    def head(cls, using=None):
+        # The sync token of everything in `using` right now: its newest entry, or the compaction horizon when even
+        # newer entries have been compacted away.
+        seq = cls.objects.using(using).order_by('-seq').values_list('seq', flat=True).first()
+        return max(seq or 0, SnippetChangeHorizon.current(using=using))
+
+    def __str__(self):
+        return '%s %s %s' % (self.seq, self.action, self.snippet_id)
+
+
+class SnippetChangeHorizon(models.Model):
+    # Single row, the highest seq compact_changes has dropped a `deleted` entry at. A consumer whose sync token is
+    # below it may have missed a deletion, so the feed tells it to resync instead of serving it the rest.
+    seq = models.BigIntegerField(default=0)
+
+    @classmethod
+    def current(cls, using=None):
+        horizon = cls.objects.using(using).filter(pk=1).values_list('seq', flat=True).first()
+        return horizon or 0
+
+    @classmethod
+    def advance(cls, seq, using=None):
+        cls.objects.using(using).get_or_create(pk=1)
+        cls.objects.using(using).filter(pk=1, seq__lt=seq).update(seq=seq)
+
+    def __str__(self):
+        return str(self.seq)
@@ -0,0 +1,40 @@
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from snippets.renderers import ColumnarJSONRenderer, msgpack
+
+
+def from_columns(data):
+    # The reverse of snippets.renderers.to_columns. A single row becomes a single object, which is what the
+    # create and update views expect.
+    if not isinstance(data, dict) or set(data) != {'columns', 'rows'}:
+        return data
+    columns, rows = data['columns'], data['rows']
+    if not isinstance(columns, list) or not isinstance(rows, list):
+        raise ParseError('Columnar data needs a list of columns and a list of rows.')
+    objects = []
+    for row in rows:
+        if not isinstance(row, list) or len(row) != len(columns):
+            raise ParseError('Every row needs one value per column.')
+        objects.append(dict(zip(columns, row)))
+    return objects[0] if len(objects) == 1 else objects
+
+
+class ColumnarJSONParser(parsers.JSONParser):
+    media_type = ColumnarJSONRenderer.media_type
+    renderer_class = ColumnarJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        data = super(ColumnarJSONParser, self).parse(stream, media_type, parser_context)
+        return from_columns(data)
+
+
+class MessagePackParser(parsers.BaseParser):
+    # Only listed in the REST_FRAMEWORK settings when the msgpack package is installed.
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError('MessagePack parse error - %s' % (exc or exc.__class__.__name__))
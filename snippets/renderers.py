@@ -0,0 +1,45 @@
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def to_columns(data):
+    # [{'id': 1, 'title': 'a'}, {'id': 2, 'title': 'b'}] -> {'columns': ['id', 'title'], 'rows': [[1, 'a'], [2, 'b']]}
+    # Paginated responses get their `results` converted, anything else is left alone.
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        data = dict(data)
+        data['results'] = to_columns(data['results'])
+        return data
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        return data
+    columns = list(data[0].keys()) if data else []
+    if any(list(row.keys()) != columns for row in data):
+        return data
+    return {'columns': columns, 'rows': [[row[column] for column in columns] for row in data]}
+
+
+class ColumnarJSONRenderer(renderers.JSONRenderer):
+    # JSON for bulk consumers: the keys of a list are sent once instead of once per object.
+    media_type = 'application/vnd.snippets.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super(ColumnarJSONRenderer, self).render(to_columns(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    # Only listed in the REST_FRAMEWORK settings when the msgpack package is installed.
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # REST framework's JSON encoder already knows how to turn dates, decimals, lazy strings... into plain types.
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
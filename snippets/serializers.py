@@ -1,5 +1,10 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
 from rest_framework import serializers
-from snippets.models import Snippet, LANGUAGE_CHOICES, STYLE_CHOICES
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from snippets.models import Snippet, SnippetChange, LANGUAGE_CHOICES, STYLE_CHOICES
 
 
 # The first part of the serializer class defines the fields that get serialized/deserialized. The create() and update()
@@ -115,15 +120,187 @@ class SnippetSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'code', 'linenos', 'language', 'style', 'owner')
 """
 
+# Sparse fieldsets and field expansion
+# Clients that only need a couple of fields can ask for them in the query string of any read request:
+#
+# /snippets/?fields=id,title       only these fields
+# /snippets/?omit=code             every field except these
+# /snippets/?expand=owner          swap a flat field for the nested serializer listed in Meta.expandable_fields
+#
+# Only the top level serializer honours the parameters, nested serializers and writes always use all their fields.
+# Names the serializer doesn't have, or can't expand, are answered with a 400.
+# Views using SparseFieldsetsMixin also pass the queryset through optimize_queryset(), so dropping a field
+# drops its column or prefetch from the SQL as well and not just from the JSON.
+def _query_param_set(request, name):
+    value = request.query_params.get(name, '')
+    return set(item.strip() for item in value.split(',') if item.strip())
+
+
+def _check_names(param, names, known, message='Unknown field: %s.'):
+    # A typo would otherwise quietly give every object no fields at all.
+    unknown = sorted(names.difference(known))
+    if unknown:
+        raise ValidationError({param: [message % name for name in unknown]})
+
+
+def _queryset_requirements(serializer, model, prefix=''):
+    # Work out what the serializer reads from `model`. Returns the columns for only() (None when some field reads
+    # something we can't see, like a property), the relations for select_related() and the Prefetch objects.
+    only = set([prefix + model._meta.pk.name])
+    select_related = []
+    prefetch = []
+    trim = True
+    for field in serializer.fields.values():
+        if field.source == '*':
+            # Identity fields like `url` and `highlight` only need the primary key.
+            continue
+        bits = field.source.split('.')
+        try:
+            model_field = model._meta.get_field(bits[0])
+        except FieldDoesNotExist:
+            trim = False
+            continue
+        path = prefix + bits[0]
+
+        if model_field.many_to_many or model_field.one_to_many:
+            related_model = model_field.related_model
+            # A reverse foreign key prefetch joins the rows back to their parent through that key, so it's needed.
+            required = [model_field.field.name] if model_field.one_to_many else []
+            if isinstance(field, serializers.ListSerializer):
+                requirements = _queryset_requirements(field.child, related_model)
+                if model_field.one_to_many and model_field.field.name in requirements[1]:
+                    # The prefetch points every child back at the parent loaded here, e.g. each user's snippets get
+                    # that user as their owner. Deferring the parent's columns would cost a query per parent.
+                    trim = False
+                related_queryset = _apply_requirements(related_model._default_manager.all(), requirements, required)
+                if model_field.one_to_many and hasattr(field, 'limit_prefetch'):
+                    # Let the list serializer cut down the rows in SQL when it only shows some of them.
+                    related_queryset = field.limit_prefetch(related_queryset, model_field.field.name)
+            else:
+                # A list of hyperlinks or primary keys, the related rows are needed for their keys only.
+                related_queryset = related_model._default_manager.only(related_model._meta.pk.name, *required)
+            prefetch.append(Prefetch(path, queryset=related_queryset))
+        elif model_field.one_to_one and not model_field.concrete:
+            # Reverse one-to-one, e.g. source='snippet_stats.snippet_count' on users.
+            select_related.append(path)
+            if len(bits) > 1:
+                only.add(prefix + '__'.join(bits))
+        elif model_field.is_relation and model_field.concrete:
+            only.add(path)
+            if isinstance(field, serializers.BaseSerializer):
+                select_related.append(path)
+                child_only, child_select_related, child_prefetch = _queryset_requirements(
+                    field, model_field.related_model, path + '__')
+                if child_only is not None:
+                    only.update(child_only)
+                select_related.extend(child_select_related)
+                prefetch.extend(child_prefetch)
+            elif len(bits) > 1:
+                # e.g. source='owner.username'
+                select_related.append(path)
+                only.add(prefix + '__'.join(bits))
+        elif model_field.concrete:
+            only.add(path)
+        else:
+            trim = False
+    return (only if trim else None), select_related, prefetch
+
+
+def _apply_requirements(queryset, requirements, required=()):
+    only, select_related, prefetch = requirements
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only.union(required))
+    return queryset
+
+
+def optimize_queryset(serializer, queryset):
+    return _apply_requirements(queryset, _queryset_requirements(serializer, queryset.model))
+
+
+class DynamicFieldsMixin(object):
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super(DynamicFieldsMixin, self).get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._is_root():
+            return fields
+
+        expandable_fields = getattr(self.Meta, 'expandable_fields', {})
+        expand = _query_param_set(request, 'expand')
+        _check_names('expand', expand, [name for name in fields if name in expandable_fields],
+                     "Field can't be expanded: %s.")
+        for name in expand:
+            serializer_class, kwargs = expandable_fields[name]
+            fields[name] = serializer_class(**kwargs)
+
+        requested = _query_param_set(request, 'fields')
+        omitted = _query_param_set(request, 'omit')
+        _check_names('fields', requested, fields)
+        _check_names('omit', omitted, fields)
+        if requested:
+            for name in set(fields) - requested:
+                fields.pop(name)
+        for name in omitted:
+            fields.pop(name, None)
+        return fields
+
+    def optimize_queryset(self, queryset):
+        return optimize_queryset(self, queryset)
+
+
+# Used for ?expand=owner instead of the bare username.
+class OwnerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
+
 # PATTERN 3 - Using HyperlinkedModelSerializer for better representations and browsebility
-class SnippetSerializer(serializers.HyperlinkedModelSerializer):
+class SnippetSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
     # We want to specify format='html' for this particular field
     highlight = serializers.HyperlinkedIdentityField(view_name='snippet-highlight', format='html')
+    # The code lives in the shared SnippetContent row. Reading it through the relation lets optimize_queryset()
+    # join the content table only when `code` is requested.
+    code = serializers.CharField(source='content.code', style={'base_template': 'textarea.html'})
 
     class Meta:
         model = Snippet
         fields = ('url', 'id', 'highlight', 'owner', 'title', 'code', 'linenos', 'language', 'style')
+        expandable_fields = {
+            'owner': (OwnerSerializer, {'read_only': True}),
+        }
+
+    # Snippet.code takes the new code and Snippet.save() finds or creates the matching content.
+    def create(self, validated_data):
+        if 'content' in validated_data:
+            validated_data['code'] = validated_data.pop('content')['code']
+        return super(SnippetSerializer, self).create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'content' in validated_data:
+            validated_data['code'] = validated_data.pop('content')['code']
+        return super(SnippetSerializer, self).update(instance, validated_data)
+
+
+# One entry of the /snippets/changes/ feed. `snippet` is the current state of the snippet, attached by the view,
+# and null once it has been deleted.
+class SnippetChangeSerializer(serializers.ModelSerializer):
+    snippet = SnippetSerializer(read_only=True)
+
+    class Meta:
+        model = SnippetChange
+        fields = ('seq', 'snippet_id', 'action', 'created', 'snippet')
 
 # One nice property that serializers have is that you can inspect all the fields in a serializer instance,
 # by printing its representation. Open the Django shell with python manage.py shell, then try the following:
@@ -0,0 +1,53 @@
+from django.db.models import F, Max
+
+from snippets.models import Snippet, SnippetChange, SnippetContent, SnippetStats
+
+
+# Every user gets a SnippetStats row when created, so the API can always read the counters through a join.
+def create_snippet_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        SnippetStats.objects.get_or_create(user=instance)
+
+
+# The counters are changed with F() expressions so concurrent writes of the same user don't overwrite each other.
+# Both receivers run inside the transaction of the snippet insert/delete.
+def snippet_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    SnippetStats.objects.get_or_create(user_id=instance.owner_id)
+    SnippetStats.objects.filter(user_id=instance.owner_id).update(
+        snippet_count=F('snippet_count') + 1, last_snippet_at=instance.created)
+
+
+def snippet_deleted(sender, instance, using, **kwargs):
+    # No get_or_create here, the owner may be getting deleted together with their snippets. The latest remaining
+    # snippet comes from the database of the delete, a replica may not have seen the newest ones.
+    last = Snippet.objects.using(using).filter(owner_id=instance.owner_id).aggregate(last=Max('created'))['last']
+    SnippetStats.objects.filter(user_id=instance.owner_id, snippet_count__gt=0).update(
+        snippet_count=F('snippet_count') - 1, last_snippet_at=last)
+
+
+# Feed the change log. Like the counters these run in the same transaction as the snippet write, so the log
+# can't miss a committed change or contain one that was rolled back.
+def log_snippet_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    action = SnippetChange.CREATED if created else SnippetChange.UPDATED
+    SnippetChange.objects.create(snippet_id=instance.pk, action=action)
+
+
+def log_snippet_deleted(sender, instance, **kwargs):
+    SnippetChange.objects.create(snippet_id=instance.pk, action=SnippetChange.DELETED)
+
+
+# Drop the snippet's reference to its content, deleting the content when it was the last one. The reference is the
+# one the primary has when the delete starts, the instance being deleted may be a stale copy. The snippet row is
+# gone by post_delete, so pre_delete looks it up.
+def remember_snippet_content(sender, instance, **kwargs):
+    instance._release_content_id = instance.current_content_id()
+
+
+def release_snippet_content(sender, instance, **kwargs):
+    content_id = getattr(instance, '_release_content_id', instance.content_id)
+    if content_id is not None:
+        SnippetContent.release(content_id)
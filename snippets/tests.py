@@ -1,3 +1,542 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from snippets.models import Snippet, SnippetChange, SnippetChangeHorizon, SnippetContent, SnippetStats
+from snippets.throttling import SnippetWriteThrottle, TokenBucketThrottle
+from snippets.views import SnippetChangeList
+
+
+class BucketThrottle(TokenBucketThrottle):
+    scope = 'test'
+    rate = '10/min'
+
+
+class HourlyBucketThrottle(TokenBucketThrottle):
+    scope = 'test'
+    rate = '100/hour'
+
+
+class WriteThrottle(SnippetWriteThrottle):
+    rate = '10/min'
+
+
+def anonymous_request(method='get', data=None):
+    factory = APIRequestFactory()
+    request = Request(getattr(factory, method)('/snippets/', data, format='json'), parsers=[JSONParser()])
+    request.user = AnonymousUser()
+    return request
+
+
+class TokenBucketThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = LocMemCache(self.id(), {})
+        self.now = 1000.0
+
+    def throttle(self, throttle_class=BucketThrottle):
+        throttle = throttle_class()
+        throttle.cache = self.cache
+        throttle.timer = lambda: self.now
+        return throttle
+
+    def test_burst_then_refill(self):
+        request = anonymous_request()
+        throttle = self.throttle()
+        self.assertEqual([throttle.allow_request(request, None) for _ in range(11)], [True] * 10 + [False])
+        # '10/min' puts a token back every 6 seconds.
+        self.assertAlmostEqual(throttle.wait(), 6.0)
+        self.now += 5.9
+        self.assertFalse(throttle.allow_request(request, None))
+        self.now += 0.1
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+
+    def test_refill_stops_at_capacity(self):
+        request = anonymous_request()
+        throttle = self.throttle()
+        throttle.allow_request(request, None)
+        self.now += 3600
+        self.assertEqual(sum(throttle.allow_request(request, None) for _ in range(20)), 10)
+
+    def test_write_cost_grows_with_code(self):
+        throttle = self.throttle(WriteThrottle)
+        self.assertEqual(throttle.get_cost(anonymous_request('post', {'code': 'x' * 999}), None), 1)
+        self.assertEqual(throttle.get_cost(anonymous_request('post', {'code': 'x' * 2500}), None), 3)
+
+        request = anonymous_request('post', {'code': 'x' * 2500})
+        self.assertEqual([throttle.allow_request(request, None) for _ in range(4)], [True, True, True, False])
+        # One token left, the next 3 token write has to wait for two more.
+        self.assertAlmostEqual(throttle.wait(), 12.0)
+
+    def test_oversized_write_goes_through_with_a_full_bucket(self):
+        throttle = self.throttle(WriteThrottle)
+        request = anonymous_request('post', {'code': 'x' * 50000})
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+
+    def test_reads_are_not_write_throttled(self):
+        throttle = self.throttle(WriteThrottle)
+        request = anonymous_request()
+        self.assertTrue(all(throttle.allow_request(request, None) for _ in range(50)))
+
+    def concurrent_allowed(self, cache, threads=8, requests=50):
+        allowed = []
+
+        def client():
+            throttle = HourlyBucketThrottle()
+            throttle.cache = cache
+            request = anonymous_request()
+            allowed.append(sum(throttle.allow_request(request, None) for _ in range(requests)))
+
+        workers = [threading.Thread(target=client) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(allowed)
+
+    def test_concurrent_callers_share_one_bucket(self):
+        self.assertEqual(self.concurrent_allowed(self.cache), 100)
+
+    def test_concurrent_callers_share_one_bucket_in_the_file_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertEqual(self.concurrent_allowed(FileBasedCache(directory, {})), 100)
+
+
+class SnippetContentTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+
+    def snippet(self, code, **kwargs):
+        return Snippet.objects.create(owner=self.owner, code=code, **kwargs)
+
+    def ref_counts(self):
+        return dict(SnippetContent.objects.values_list('code', 'ref_count'))
+
+    def test_identical_snippets_share_content(self):
+        first = self.snippet('print(1)\n')
+        second = self.snippet('print(1)\n')
+        self.assertEqual(first.content_id, second.content_id)
+        self.assertEqual(self.ref_counts(), {'print(1)\n': 2})
+        self.assertIn('print', Snippet.objects.get(pk=second.pk).highlighted)
+
+    def test_options_are_part_of_the_content(self):
+        first = self.snippet('print(1)\n')
+        second = self.snippet('print(1)\n', linenos=True)
+        self.assertNotEqual(first.content_id, second.content_id)
+        self.assertEqual(SnippetContent.objects.count(), 2)
+
+    def test_edit_moves_the_reference(self):
+        first = self.snippet('a = 1\n')
+        second = self.snippet('a = 1\n')
+        second.code = 'b = 2\n'
+        second.save()
+        self.assertNotEqual(first.content_id, second.content_id)
+        self.assertEqual(self.ref_counts(), {'a = 1\n': 1, 'b = 2\n': 1})
+        self.assertEqual(Snippet.objects.get(pk=second.pk).code, 'b = 2\n')
+
+    def test_edit_to_the_same_content_keeps_the_reference(self):
+        snippet = self.snippet('a = 1\n')
+        snippet.code = 'a = 1\n'
+        snippet.save()
+        self.assertEqual(self.ref_counts(), {'a = 1\n': 1})
+
+    def test_delete_releases_the_reference(self):
+        first = self.snippet('a = 1\n')
+        self.snippet('a = 1\n')
+        first.delete()
+        self.assertEqual(self.ref_counts(), {'a = 1\n': 1})
+
+    def test_last_reference_deletes_the_row(self):
+        first = self.snippet('a = 1\n')
+        second = self.snippet('a = 1\n')
+        first.delete()
+        second.delete()
+        self.assertFalse(SnippetContent.objects.exists())
+
+    def test_edit_away_from_unshared_content_deletes_the_row(self):
+        snippet = self.snippet('a = 1\n')
+        snippet.code = 'b = 2\n'
+        snippet.save()
+        self.assertEqual(self.ref_counts(), {'b = 2\n': 1})
+
+    def test_acquire_recreates_released_content(self):
+        content = SnippetContent.acquire('a = 1\n', 'python', 'friendly', False, '')
+        SnippetContent.release(content.digest)
+        self.assertFalse(SnippetContent.objects.exists())
+        again = SnippetContent.acquire('a = 1\n', 'python', 'friendly', False, '')
+        self.assertEqual(again.digest, content.digest)
+        self.assertEqual(again.ref_count, 1)
+
+
+class StaleSnippetContentTests(TestCase):
+    # A snippet loaded from a lagging replica, or long before it's saved, carries the content_id it had back
+    # then. Saving or deleting it must give up the reference the database has now.
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+
+    def snippet(self, code):
+        return Snippet.objects.create(owner=self.owner, code=code)
+
+    def ref_counts(self):
+        return dict(SnippetContent.objects.values_list('code', 'ref_count'))
+
+    def move(self, snippet, code):
+        fresh = Snippet.objects.get(pk=snippet.pk)
+        fresh.code = code
+        fresh.save()
+
+    def test_stale_save_does_not_release_shared_content(self):
+        first = self.snippet('x = 1\n')
+        self.snippet('x = 1\n')
+        stale = Snippet.objects.get(pk=first.pk)
+        self.move(first, 'y = 2\n')
+        stale.code = 'z = 3\n'
+        stale.save()
+        self.assertEqual(self.ref_counts(), {'x = 1\n': 1, 'z = 3\n': 1})
+
+    def test_stale_save_releases_the_current_content(self):
+        snippet = self.snippet('x = 1\n')
+        stale = Snippet.objects.get(pk=snippet.pk)
+        self.move(snippet, 'y = 2\n')
+        stale.code = 'z = 3\n'
+        stale.save()
+        self.assertEqual(self.ref_counts(), {'z = 3\n': 1})
+
+    def test_stale_save_of_the_current_content_keeps_one_reference(self):
+        snippet = self.snippet('x = 1\n')
+        stale = Snippet.objects.get(pk=snippet.pk)
+        self.move(snippet, 'y = 2\n')
+        stale.code = 'y = 2\n'
+        stale.save()
+        self.assertEqual(self.ref_counts(), {'y = 2\n': 1})
+        self.assertEqual(Snippet.objects.get(pk=snippet.pk).content.code, 'y = 2\n')
+
+    def test_stale_delete_releases_the_current_content(self):
+        first = self.snippet('x = 1\n')
+        self.snippet('x = 1\n')
+        stale = Snippet.objects.get(pk=first.pk)
+        self.move(first, 'y = 2\n')
+        stale.delete()
+        self.assertEqual(self.ref_counts(), {'x = 1\n': 1})
+
+
+class ApiRootTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+
+    def test_format_override_is_not_served_to_other_requests(self):
+        self.assertTrue(self.client.get('/?format=json').json()['snippets'].endswith('/snippets/?format=json'))
+        self.assertTrue(self.client.get('/', HTTP_ACCEPT='application/json').json()['snippets'].endswith(
+            '/snippets/'))
+        self.assertTrue(self.client.get('/.json').json()['snippets'].endswith('/snippets.json'))
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.owner = User.objects.create(username='owner')
+
+    def snippet(self, code):
+        return Snippet.objects.create(owner=self.owner, code=code)
+
+    def feed(self, query=''):
+        return self.client.get('/snippets/changes/' + query)
+
+    def age_changes(self, days=30):
+        SnippetChange.objects.update(created=timezone.now() - timedelta(days=days))
+
+    def compact(self):
+        call_command('compact_changes', stdout=StringIO())
+
+    def test_since_and_limit_page_through_the_changes(self):
+        snippets = [self.snippet('x = %d\n' % i) for i in range(5)]
+        seen = []
+        since = 0
+        while True:
+            data = self.feed('?since=%d&limit=2' % since).json()
+            self.assertLessEqual(len(data['changes']), 2)
+            if not data['changes']:
+                self.assertEqual(data['next'], since)
+                break
+            seen += [change['snippet_id'] for change in data['changes']]
+            since = data['next']
+        self.assertEqual(seen, [snippet.pk for snippet in snippets])
+
+    def test_changes_carry_the_current_state(self):
+        kept = self.snippet('x = 1\n')
+        gone = self.snippet('y = 2\n')
+        gone_pk = gone.pk
+        gone.delete()
+        kept.title = 'renamed'
+        kept.save()
+        changes = self.feed().json()['changes']
+        self.assertEqual([(change['snippet_id'], change['action']) for change in changes], [
+            (kept.pk, 'created'), (gone_pk, 'created'), (gone_pk, 'deleted'), (kept.pk, 'updated')])
+        self.assertEqual(changes[0]['snippet']['title'], 'renamed')
+        self.assertIsNone(changes[1]['snippet'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.feed('?since=abc').status_code, 400)
+        self.assertEqual(self.feed('?limit=abc').status_code, 400)
+
+    def test_snippet_list_carries_the_token_to_continue_from(self):
+        self.snippet('x = 1\n')
+        token = self.client.get('/snippets/')['X-Changes-Since']
+        self.assertEqual(int(token), SnippetChange.objects.latest('seq').seq)
+        self.assertEqual(self.feed('?since=' + token).json()['changes'], [])
+        later = self.snippet('y = 2\n')
+        self.assertEqual([change['snippet_id'] for change in self.feed('?since=' + token).json()['changes']],
+                         [later.pk])
+
+    def test_compaction_drops_superseded_and_deleted_entries(self):
+        kept = self.snippet('x = 1\n')
+        gone = self.snippet('y = 2\n')
+        gone.delete()
+        kept.title = 'renamed'
+        kept.save()
+        tombstone = SnippetChange.objects.get(action=SnippetChange.DELETED).seq
+        self.age_changes()
+        self.compact()
+        self.assertEqual(list(SnippetChange.objects.values_list('snippet_id', 'action')),
+                         [(kept.pk, SnippetChange.UPDATED)])
+        self.assertEqual(SnippetChangeHorizon.current(), tombstone)
+
+    def test_compaction_keeps_recent_entries(self):
+        gone = self.snippet('y = 2\n')
+        gone.delete()
+        self.compact()
+        self.assertEqual(SnippetChange.objects.count(), 2)
+        self.assertEqual(SnippetChangeHorizon.current(), 0)
+
+    def test_consumer_behind_the_horizon_is_told_to_resync(self):
+        self.snippet('x = 1\n').delete()
+        self.age_changes()
+        self.compact()
+        response = self.feed('?since=0')
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['reset'])
+        self.assertTrue(response.json()['snapshot'].endswith('/snippets/'))
+
+        # Starting over from the list gets the consumer going again.
+        token = self.client.get('/snippets/')['X-Changes-Since']
+        self.assertEqual(int(token), SnippetChangeHorizon.current())
+        self.assertEqual(self.feed('?since=' + token).status_code, 200)
+
+    def test_horizon_only_moves_forward(self):
+        SnippetChangeHorizon.advance(10)
+        SnippetChangeHorizon.advance(5)
+        self.assertEqual(SnippetChangeHorizon.current(), 10)
+
+    def test_waits_are_capped(self):
+        for _ in range(SnippetChangeList.max_waiters):
+            SnippetChangeList.waiters.acquire()
+        try:
+            start = time.time()
+            response = self.feed('?wait=5')
+            self.assertLess(time.time() - start, 1)
+        finally:
+            for _ in range(SnippetChangeList.max_waiters):
+                SnippetChangeList.waiters.release()
+        self.assertEqual(response.status_code, 200)
+
+
+class SparseFieldsetsTests(TestCase):
+    # optimize_queryset() should turn the fields a request asks for into the columns, joins and prefetches of its
+    # queries, and nothing more.
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.group = Group.objects.create(name='editors')
+
+    def add_users(self, count):
+        for i in range(count):
+            user = User.objects.create(username='user%d-%d' % (User.objects.count(), i))
+            user.groups.add(self.group)
+            Snippet.objects.create(owner=user, code='x = %d\n' % i)
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, [query['sql'] for query in queries]
+
+    def snippet_list_query(self, queries):
+        # The list reads the snippets in one query, the other two read the change feed token (X-Changes-Since).
+        self.assertEqual(len(queries), 3)
+        reads = [query for query in queries if 'FROM "snippets_snippet" ' in query]
+        self.assertEqual(len(reads), 1)
+        return reads[0]
+
+    def assert_constant_queries(self, path):
+        self.add_users(2)
+        _, few = self.get(path)
+        self.add_users(5)
+        _, many = self.get(path)
+        self.assertEqual(len(few), len(many))
+        return many
+
+    def test_snippet_list_reads_the_snippets_in_one_query(self):
+        self.add_users(3)
+        _, queries = self.get('/snippets/')
+        query = self.snippet_list_query(queries)
+        self.assertIn('"snippets_snippetcontent"."code"', query)
+        self.assertIn('"auth_user"."username"', query)
+        self.assertNotIn('"auth_user"."password"', query)
+
+    def test_fields_limits_the_columns(self):
+        self.add_users(3)
+        response, queries = self.get('/snippets/?fields=id,title')
+        self.assertEqual(set(response.json()[0]), {'id', 'title'})
+        query = self.snippet_list_query(queries)
+        self.assertIn('"snippets_snippet"."title"', query)
+        self.assertNotIn('"snippets_snippet"."language"', query)
+        self.assertNotIn('snippets_snippetcontent', query)
+        self.assertNotIn('auth_user', query)
+
+    def test_omit_drops_the_join(self):
+        self.add_users(3)
+        response, queries = self.get('/snippets/?omit=code')
+        self.assertNotIn('code', response.json()[0])
+        query = self.snippet_list_query(queries)
+        self.assertIn('"snippets_snippet"."language"', query)
+        self.assertNotIn('snippets_snippetcontent', query)
+
+    def test_expand_owner_joins_the_owner_columns_it_needs(self):
+        self.add_users(3)
+        response, queries = self.get('/snippets/?expand=owner')
+        self.assertEqual(set(response.json()[0]['owner']), {'id', 'username'})
+        query = self.snippet_list_query(queries)
+        self.assertIn('"auth_user"."username"', query)
+        self.assertNotIn('"auth_user"."password"', query)
+
+    def test_user_list_queries_do_not_grow_with_the_users(self):
+        queries = self.assert_constant_queries('/users/')
+        self.assertTrue(any('auth_user_groups' in query for query in queries))
+        self.assertTrue(any('snippets_snippetstats' in query for query in queries))
+
+    def test_user_fields_skip_groups_and_stats(self):
+        self.add_users(3)
+        _, queries = self.get('/users/?fields=id,username')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('snippets_snippetstats', queries[0])
+        self.assertNotIn('"auth_user"."password"', queries[0])
+
+    def test_user_snippet_count_joins_the_stats(self):
+        self.add_users(3)
+        response, queries = self.get('/users/?fields=id,snippet_count')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"snippets_snippetstats"."snippet_count"', queries[0])
+        self.assertNotIn('auth_user_groups', queries[0])
+        self.assertEqual(sorted(user['snippet_count'] for user in response.json()), [0, 1, 1, 1])
+
+    def test_user_groups_is_one_prefetch(self):
+        queries = self.assert_constant_queries('/users/?fields=id,groups')
+        self.assertEqual(len(queries), 2)
+
+    def test_expand_snippets_prefetches_a_page_per_user(self):
+        self.add_users(2)
+        user = User.objects.get(username='user1-0')
+        for i in range(12):
+            Snippet.objects.create(owner=user, code='y = %d\n' % i)
+        response, queries = self.get('/users/?fields=id,snippets&expand=snippets')
+        prefetch = [query for query in queries if 'FROM "snippets_snippet" ' in query]
+        self.assertEqual(len(prefetch), 1)
+        self.assertIn('LIMIT 10', prefetch[0])
+        snippets = dict((row['id'], row['snippets']) for row in response.json())
+        page = self.client.get('/users/%d/snippets/' % user.pk).json()['results']
+        self.assertEqual([snippet['id'] for snippet in snippets[user.pk]], [snippet['id'] for snippet in page])
+
+    def test_unknown_names_are_rejected(self):
+        for query, param in (('fields=id,nope', 'fields'), ('omit=nope', 'omit'), ('expand=title', 'expand')):
+            response = self.client.get('/snippets/?' + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn(param, response.json())
+
+    def test_writes_ignore_the_parameters(self):
+        response = self.client.post('/snippets/?fields=nope', {'code': 'x = 1\n'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('code', response.json())
+
+
+class SnippetStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+
+    def stats(self, user=None):
+        return SnippetStats.objects.get(user=user or self.user)
+
+    def test_new_users_get_empty_stats(self):
+        stats = self.stats()
+        self.assertEqual(stats.snippet_count, 0)
+        self.assertIsNone(stats.last_snippet_at)
+
+    def test_creating_and_deleting_snippets_keeps_the_counters(self):
+        first = Snippet.objects.create(owner=self.user, code='x = 1\n')
+        second = Snippet.objects.create(owner=self.user, code='x = 2\n')
+        self.assertEqual(self.stats().snippet_count, 2)
+        self.assertEqual(self.stats().last_snippet_at, second.created)
+
+        second.delete()
+        self.assertEqual(self.stats().snippet_count, 1)
+        self.assertEqual(self.stats().last_snippet_at, first.created)
+        first.delete()
+        self.assertEqual(self.stats().snippet_count, 0)
+        self.assertIsNone(self.stats().last_snippet_at)
+
+    def test_updates_do_not_count(self):
+        snippet = Snippet.objects.create(owner=self.user, code='x = 1\n')
+        snippet.title = 'renamed'
+        snippet.save()
+        self.assertEqual(self.stats().snippet_count, 1)
+
+    def test_recount_snippets_reports_and_rebuilds_drifted_counters(self):
+        snippet = Snippet.objects.create(owner=self.user, code='x = 1\n')
+        other = User.objects.create(username='bob')
+        Snippet.objects.create(owner=other, code='x = 2\n')
+        SnippetStats.objects.filter(user=self.user).update(snippet_count=5, last_snippet_at=None)
+        SnippetStats.objects.filter(user=other).delete()
+
+        out = StringIO()
+        call_command('recount_snippets', dry_run=True, stdout=out)
+        self.assertIn('1 users without stats, 1 with drifted counters.', out.getvalue())
+        self.assertEqual(self.stats().snippet_count, 5)
+        self.assertFalse(SnippetStats.objects.filter(user=other).exists())
+
+        out = StringIO()
+        call_command('recount_snippets', stdout=out)
+        self.assertIn('Snippet stats rebuilt.', out.getvalue())
+        self.assertEqual(self.stats().snippet_count, 1)
+        self.assertEqual(self.stats().last_snippet_at, snippet.created)
+        self.assertEqual(self.stats(other).snippet_count, 1)
+
+        out = StringIO()
+        call_command('recount_snippets', dry_run=True, stdout=out)
+        self.assertIn('0 users without stats, 0 with drifted counters.', out.getvalue())
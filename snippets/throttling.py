@@ -0,0 +1,112 @@
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from rest_framework import permissions
+from rest_framework.throttling import SimpleRateThrottle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Updating a bucket is a read followed by a write, two requests of the same client must not interleave there or
+# both spend the same tokens. The keys are spread over a fixed number of locks, so there's no lock per client to
+# clean up: a thread lock within the process and, for the file based cache, a lock file shared by every process.
+# Other shared backends (memcached, redis) would need an atomic update in the store itself.
+LOCK_STRIPES = 64
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+@contextmanager
+def bucket_lock(cache, key):
+    stripe = zlib.crc32(key.encode('utf-8')) % LOCK_STRIPES
+    with _thread_locks[stripe]:
+        if fcntl is None or not isinstance(cache, FileBasedCache):
+            yield
+            return
+        os.makedirs(cache._dir, exist_ok=True)
+        with open(os.path.join(cache._dir, 'bucket-%02d.lock' % stripe), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# REST framework's SimpleRateThrottle keeps the timestamp of every request in the window, so its cache entries grow
+# with the rate. A token bucket only needs the number of tokens left and when it was last refilled, two floats per
+# client whatever the rate is. The bucket holds `num_requests` tokens and refills completely in `duration` seconds,
+# so a '60/min' rate allows bursts of 60 and one more request every second after that.
+#
+# The counters live in the 'throttle' cache (see CACHES in settings.py). The default in-process cache gives every
+# worker its own buckets, TUTORIAL_THROTTLE_CACHE=file shares them between all workers on the machine.
+class TokenBucketThrottle(SimpleRateThrottle):
+    cache = caches['throttle']
+    # None throttles every method.
+    methods = None
+
+    def get_cache_key(self, request, view):
+        if self.methods is not None and request.method not in self.methods:
+            return None
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_cost(self, request, view):
+        return 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        capacity = float(self.num_requests)
+        refill_rate = capacity / self.duration
+        # A request bigger than the whole bucket may still go through once it's full.
+        cost = min(self.get_cost(request, view), capacity)
+
+        with bucket_lock(self.cache, self.key):
+            now = self.timer()
+            tokens, last = self.cache.get(self.key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * refill_rate)
+            if tokens < cost:
+                self.wait_seconds = (cost - tokens) / refill_rate
+                self.cache.set(self.key, (tokens, now), self.duration)
+                return False
+            self.cache.set(self.key, (tokens - cost, now), self.duration)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SnippetReadThrottle(TokenBucketThrottle):
+    scope = 'snippet_reads'
+    methods = permissions.SAFE_METHODS
+
+
+class SnippetWriteThrottle(TokenBucketThrottle):
+    # Creating or updating a snippet runs Pygments over the whole code, so big snippets cost more tokens.
+    scope = 'snippet_writes'
+    methods = ('POST', 'PUT', 'PATCH', 'DELETE')
+    code_chars_per_token = 1000
+
+    def get_cost(self, request, view):
+        code = request.data.get('code', '') if hasattr(request.data, 'get') else ''
+        if not isinstance(code, str):
+            return 1
+        return 1 + len(code) // self.code_chars_per_token
+
+
+class UserThrottle(TokenBucketThrottle):
+    scope = 'users'
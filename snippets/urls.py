@@ -34,14 +34,22 @@ from rest_framework.urlpatterns import format_suffix_patterns
 from snippets import views
 
 # API endpoints
+# Django tries URL patterns one after the other, so every pattern in front of a route costs a regex match on each
+# request. The snippet routes are the busiest ones, so all the routes below /snippets/ sit behind a single
+# '^snippets/' prefix: one match picks the group and only the snippet patterns are tried after it.
+snippet_patterns = format_suffix_patterns([
+    url(r'^(?P<pk>[0-9]+)/$', views.SnippetDetail.as_view(), name='snippet-detail'),
+    url(r'^(?P<pk>[0-9]+)/highlight/$', views.SnippetHighlight.as_view(), name='snippet-highlight'),
+    url(r'^changes/$', views.SnippetChangeList.as_view(), name='snippet-changes'),
+])
+
 urlpatterns = format_suffix_patterns([
     #url(r'^$', views.api_root),
     url(r'^snippets/$', views.SnippetList.as_view(), name='snippet-list'),
-    url(r'^snippets/(?P<pk>[0-9]+)/$', views.SnippetDetail.as_view(), name='snippet-detail'),
-    url(r'^snippets/(?P<pk>[0-9]+)/highlight/$', views.SnippetHighlight.as_view(), name='snippet-highlight'),
-    #url(r'^users/$', views.UserList.as_view(), name='user-list'),
-    #url(r'^users/(?P<pk>[0-9]+)/$', views.UserDetail.as_view(), name='user-detail')
 ])
+urlpatterns += [
+    url(r'^snippets/', include(snippet_patterns)),
+]
 
 # Login and logout views for the browsable API
 urlpatterns += [
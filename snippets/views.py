@@ -248,27 +248,50 @@ class SnippetDetail(mixins.RetrieveModelMixin,
 # module even more.
 
 
-from snippets.models import Snippet
+from snippets.models import Snippet, SnippetChange
 from snippets.serializers import SnippetSerializer
 from snippets.permissions import IsOwnerOrReadOnly
+from snippets.throttling import SnippetReadThrottle, SnippetWriteThrottle
 from rest_framework import generics
 from rest_framework import permissions
 
+
+# Lets the serializer trim the queryset to the fields a read request asked for (?fields=, ?omit=, ?expand=),
+# see DynamicFieldsMixin in snippets/serializers.py.
+class SparseFieldsetsMixin(object):
+    def get_queryset(self):
+        queryset = super(SparseFieldsetsMixin, self).get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = self.get_serializer().optimize_queryset(queryset)
+        return queryset
+
+
 # PATTERN 5 - List - 'GET', 'POST'
-class SnippetList(generics.ListCreateAPIView):
+class SnippetList(SparseFieldsetsMixin, generics.ListCreateAPIView):
     queryset = Snippet.objects.all()
     serializer_class = SnippetSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    throttle_classes = (SnippetReadThrottle, SnippetWriteThrottle)
+    # The snapshot a change feed consumer starts from, see the change feed below. The token is read before the list
+    # and from the same database, a replica included, so no change falls between the two.
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.using(queryset.db)
+        token = SnippetChange.head(using=queryset.db)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, headers={'X-Changes-Since': str(token)})
+
     # It can be overriden even hire.
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
         print('Sending email...')
 
 # PATTERN 5 - Detail - 'GET', 'PUT', 'DETAIL'
-class SnippetDetail(generics.RetrieveUpdateDestroyAPIView):
+class SnippetDetail(SparseFieldsetsMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Snippet.objects.all()
     serializer_class = SnippetSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly)
+    throttle_classes = (SnippetReadThrottle, SnippetWriteThrottle)
     # Or more sophisticated things ...
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -277,7 +300,95 @@ class SnippetDetail(generics.RetrieveUpdateDestroyAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+from snippets.models import SnippetChange, SnippetChangeHorizon
+from snippets.serializers import SnippetChangeSerializer
+
+
+# Change feed
+# Mirrors used to poll SnippetList and download every snippet to find what changed. Instead they can keep the seq
+# of the last change they've seen and ask for what happened after it:
+#
+# /snippets/changes/?since=120              up to `limit` changes after seq 120, and the token for the next call
+# /snippets/changes/?since=120&wait=10      long poll, hold the request until something changes or 10 seconds pass
+#
+# A consumer starts from a full GET /snippets/ and its X-Changes-Since header, the token of that list. The header
+# is read from the same database as the list, so a lagging replica only means the feed repeats a few changes.
+# A snippet changed several times in one batch shows up once per change, all carrying its current state.
+# Old entries are removed by `python manage.py compact_changes`. When that dropped `deleted` entries a consumer
+# hasn't seen yet, it gets a 410 with "reset": true instead and has to start over from the list.
+#
+# The feed reads the primary, the replicas only move when they are synced and the poll would wait for nothing.
+# A waiting client holds a worker thread, with sync workers a whole worker process. So `wait` is capped at
+# max_wait seconds and at most max_waiters requests per process wait at a time. The others get an answer right
+# away and poll again.
+class SnippetChangeList(generics.GenericAPIView):
+    queryset = SnippetChange.objects.all()
+    serializer_class = SnippetChangeSerializer
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    throttle_classes = (SnippetReadThrottle,)
+    default_limit = 100
+    max_limit = 1000
+    max_wait = 15
+    max_waiters = 8
+    poll_interval = 0.5
+    waiters = threading.BoundedSemaphore(max_waiters)
+
+    def get_int_param(self, name, default, maximum):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: 'A whole number is required.'})
+        return max(0, min(value, maximum))
+
+    def get_queryset(self):
+        return super(SnippetChangeList, self).get_queryset().using(DEFAULT_DB_ALIAS)
+
+    def get(self, request, *args, **kwargs):
+        since = self.get_int_param('since', 0, 2 ** 63 - 1)
+        limit = self.get_int_param('limit', self.default_limit, self.max_limit) or self.default_limit
+        wait = self.get_int_param('wait', 0, self.max_wait)
+
+        if since < SnippetChangeHorizon.current(using=DEFAULT_DB_ALIAS):
+            return Response({
+                'detail': 'Changes after this token have been compacted away, sync all snippets again and continue '
+                          'from the X-Changes-Since header of that list.',
+                'reset': True,
+                'snapshot': reverse('snippet-list', request=request),
+            }, status=status.HTTP_410_GONE)
+
+        waiting = wait > 0 and self.waiters.acquire(False)
+        try:
+            deadline = time.time() + (wait if waiting else 0)
+            while True:
+                changes = list(self.get_queryset().filter(seq__gt=since)[:limit])
+                if changes or time.time() >= deadline:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            if waiting:
+                self.waiters.release()
+
+        snippet_ids = set(change.snippet_id for change in changes if change.action != SnippetChange.DELETED)
+        snippets = Snippet.objects.using(DEFAULT_DB_ALIAS).select_related('owner', 'content').in_bulk(snippet_ids)
+        for change in changes:
+            change.snippet = snippets.get(change.snippet_id)
+
+        return Response({
+            'next': changes[-1].seq if changes else since,
+            'changes': self.get_serializer(changes, many=True).data,
+        })
+
+
+from django.core.cache import cache
+from django.urls import get_script_prefix
 from rest_framework.decorators import api_view
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
@@ -287,13 +398,23 @@ from rest_framework.reverse import reverse
 # Two things should be noticed here. First, we're using REST framework's reverse function in order to return
 # fully-qualified URLs; second, URL patterns are identified by convenience names that we will declare later
 # on in our snippets/urls.py.
+#
+# The links only depend on where the API is served from, so they are reversed once per scheme, host, script prefix
+# and format and then served from the cache. REST framework's reverse() copies a ?format= override into the links,
+# so that's part of the key as well.
 @api_view(['GET'])
 def api_root(request, format=None):
-    return Response({
-        'users': reverse('user-list', request=request, format=format),
-        'snippets': reverse('snippet-list', request=request, format=format),
-        'groups': reverse('group-list', request=request, format=format)
-    })
+    key = 'api_root:%s:%s:%s:%s:%s' % (request.scheme, request.get_host(), get_script_prefix(), format,
+                                       request.query_params.get(api_settings.URL_FORMAT_OVERRIDE))
+    data = cache.get(key)
+    if data is None:
+        data = {
+            'users': reverse('user-list', request=request, format=format),
+            'snippets': reverse('snippet-list', request=request, format=format),
+            'groups': reverse('group-list', request=request, format=format)
+        }
+        cache.set(key, data, None)
+    return Response(data)
 
 
 from rest_framework import renderers
@@ -309,8 +430,9 @@ from rest_framework.response import Response
 # Instead of using a concrete generic view, we'll use the base class for representing instances,
 # and create our own .get() method.
 class SnippetHighlight(generics.GenericAPIView):
-    queryset = Snippet.objects.all()
+    queryset = Snippet.objects.select_related('content').only('content', 'content__highlighted')
     renderer_classes = (renderers.StaticHTMLRenderer,)
+    throttle_classes = (SnippetReadThrottle,)
 
     def get(self, request, *args, **kwargs):
         snippet = self.get_object()
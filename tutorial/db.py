@@ -0,0 +1,140 @@
+# Database plumbing for the tutorial project: read replica routing, read-your-writes stickiness and
+# SQLite connection tuning.
+#
+# The router is enabled through DATABASE_ROUTERS in settings.py. Reads of the models served by the API
+# (snippets and auth users/groups) are spread across the aliases listed in settings.DATABASE_REPLICAS, while every
+# write goes to the 'default' (primary) database. Replicas lag behind the primary, so once a client has written
+# something we keep sending its reads to the primary for REPLICA_PIN_SECONDS. Within a single request the same happens
+# as soon as the first write is routed, e.g. SnippetList.perform_create() followed by rendering the new snippet.
+# Requests that are going to write (POST, PUT, PATCH, DELETE) read from the primary from the start. What they load
+# before writing, like the snippet an update starts from, must not be a stale replica copy.
+# Writes outside of a request (shell, management commands) don't pin anything, use pin_to_primary() there.
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+# Apps whose reads may be served by a replica. Sessions, admin log, content types etc. always stay on the primary.
+REPLICATED_APPS = ('snippets', 'auth')
+
+PIN_COOKIE_NAME = 'primary_pin'
+PIN_CACHE_KEY = 'primary_pin:user:%s'
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    # Route every read of the current thread to the primary until unpin() is called.
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = False
+    _state.wrote = False
+    _state.checked_user = None
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or getattr(_state, 'wrote', False) or user_pinned()
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+def authenticated_user(request):
+    # The user of the request if authentication has already happened. REST framework authenticates inside the
+    # view and then sets request.user, before that it's the lazy session user of AuthenticationMiddleware, which
+    # we don't evaluate here: loading it reads auth.User, which would come right back to the router.
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+def user_pinned():
+    # API clients using Basic or token auth often don't keep cookies, so a write also pins the user in the cache.
+    request = getattr(_state, 'request', None)
+    if request is None:
+        return False
+    user = authenticated_user(request)
+    if user is None:
+        return False
+    if getattr(_state, 'checked_user', None) != user.pk:
+        _state.checked_user = user.pk
+        _state.user_pinned = bool(cache.get(PIN_CACHE_KEY % user.pk))
+    return _state.user_pinned
+
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICATED_APPS:
+            return DEFAULT_DB_ALIAS
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICATED_APPS and getattr(_state, 'request', None) is not None:
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # All aliases hold the same data, so relations between objects fetched from any of them are fine.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The SQLite stand-in replicas need the schema too, see the sync_replicas management command.
+        return True
+
+
+class PrimaryPinningMiddleware(object):
+    # Gives a client read-your-writes consistency. A request that wrote to the primary sets a short-lived cookie
+    # and, for an authenticated user, an entry in the default cache. Every request carrying the cookie or made by
+    # that user reads from the primary as well. The cache has to be shared by all the workers for the latter, with
+    # the per process LocMemCache only the worker that handled the write knows about it.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE_NAME, 0))
+        except ValueError:
+            pinned_until = 0
+        unpin()
+        if pinned_until > time.time() or request.method not in SAFE_METHODS:
+            pin_to_primary()
+        _state.request = request
+        try:
+            response = self.get_response(request)
+            if has_written():
+                seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+                response.set_cookie(PIN_COOKIE_NAME, str(time.time() + seconds), max_age=seconds, httponly=True)
+                user = authenticated_user(request)
+                if user is not None:
+                    cache.set(PIN_CACHE_KEY % user.pk, True, seconds)
+            return response
+        finally:
+            _state.request = None
+            unpin()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    # Receiver for the connection_created signal. WAL mode lets readers and the single writer work concurrently,
+    # which matters once persistent connections (CONN_MAX_AGE) keep several of them open at the same time.
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.cursor()
+    for pragma in getattr(settings, 'SQLITE_PRAGMAS', ()):
+        cursor.execute('PRAGMA %s' % pragma)
+    cursor.close()
@@ -0,0 +1,56 @@
+# Warm start for the WSGI workers.
+#
+# Lots of work happens lazily on the first requests a worker serves: importing the views, compiling the URL patterns
+# and their reverse tables, the imports and model metadata caches a ModelSerializer goes through when it builds its
+# fields, importing Pygments lexers and styles and compiling the lexers' regexes. preload() does all of that up
+# front. With TUTORIAL_PRELOAD=1 and `gunicorn --preload`, tutorial/wsgi.py runs it once in the master process and
+# the forked workers share the result copy-on-write instead of each one paying for it on live traffic.
+# `python manage.py bench_warmup` measures the difference.
+import gc
+
+from django.conf import settings
+
+
+def preload():
+    from django.db import connections
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+    from pygments import highlight
+    from pygments.formatters.html import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+    from quickstart.serializers import GroupSerializer, UserSerializer
+    from snippets.serializers import SnippetChangeSerializer, SnippetSerializer
+
+    # Imports every view and fills the resolver's reverse lookup tables.
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+    # REST framework builds the fields again for every serializer instance, these are thrown away. What stays is
+    # what building them loads: the field classes and the models' _meta caches (related objects, field maps).
+    for serializer_class in (SnippetSerializer, SnippetChangeSerializer, UserSerializer, GroupSerializer):
+        serializer_class().fields
+
+    # A lexer compiles its regexes the first time it tokenizes something.
+    formatter = HtmlFormatter(full=True)
+    for language in settings.PRELOAD['LEXERS']:
+        try:
+            highlight('x', get_lexer_by_name(language), formatter)
+        except ClassNotFound:
+            pass
+    lexer = get_lexer_by_name('text')
+    for style in settings.PRELOAD['STYLES']:
+        try:
+            highlight('x', lexer, HtmlFormatter(style=style, full=True))
+        except ClassNotFound:
+            pass
+
+    get_template('rest_framework/api.html')
+
+    # Connections must not be shared with the forked workers, each one opens its own.
+    connections.close_all()
+    # Everything loaded so far lives as long as the process. Freezing it keeps the garbage collector from
+    # touching those objects in the workers, which would copy their memory pages.
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
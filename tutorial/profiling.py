@@ -0,0 +1,218 @@
+# On-demand profiling of slow requests.
+#
+# With PROFILING['ENABLED'] a background thread samples the stack of every thread that is serving a request each
+# SAMPLE_INTERVAL_MS. Requests slower than THRESHOLD_MS keep their samples, the rest are thrown away. An admin can
+# force a profile of any request by sending the X-Profile header, such requests run under cProfile as well. The
+# header works with session logins and with REST framework's authentication classes (e.g. Basic auth).
+# The last KEEP profiles are kept in memory by each worker process and served to admins by:
+#
+# /profiles/                   summaries, newest first
+# /profiles/<id>/              one profile, with the cProfile report when there is one
+# /profiles/<id>/collapsed/    the samples as collapsed stacks, ready for flamegraph.pl or speedscope
+#
+# Each worker only lists what it captured itself, with several workers /profiles/ shows whatever the worker that
+# answers happens to have. Every profile carries the pid of its worker and the ids are only unique per worker,
+# so look a profile up again until the same pid answers, or run a single worker while investigating.
+#
+# Sampling tells us whether a slow SnippetList or SnippetHighlight spends its time in Pygments, serialization or
+# the database without the overhead of tracing every call of every request.
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.urls import reverse as django_reverse
+from django.utils import timezone
+from rest_framework import exceptions, permissions, renderers
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+MAX_STACK_DEPTH = 128
+
+_profiles = deque(maxlen=settings.PROFILING['KEEP'])
+_profile_ids = itertools.count(1)
+
+
+def collapse_stack(frame):
+    # 'outermost;...;innermost', one entry per frame, the format flame graph tools read.
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append('%s.%s:%d' % (frame.f_globals.get('__name__', '?'), code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class StackSampler(object):
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.thread = None
+        self.pid = None
+
+    def start(self, thread_id):
+        samples = Counter()
+        with self.lock:
+            self.active[thread_id] = samples
+            # Threads don't survive a fork, so a worker forked from a process that already sampled starts its own.
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, name='stack-sampler')
+                self.thread.daemon = True
+                self.thread.start()
+        return samples
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[collapse_stack(frame)] += 1
+
+
+class ProfilingMiddleware(object):
+    # Needs request.user, so it goes after AuthenticationMiddleware.
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.PROFILING['THRESHOLD_MS']
+        self.header = settings.PROFILING['HEADER']
+        self.sampler = StackSampler(settings.PROFILING['SAMPLE_INTERVAL_MS'] / 1000.0)
+
+    def is_staff(self, request):
+        if request.user.is_staff:
+            return True
+        # REST framework only authenticates inside the view, an admin using e.g. Basic auth is still anonymous
+        # here. Ask its authenticators, only for the requests carrying the header. They set request.user as a side
+        # effect, which is put back so the view authenticates the request exactly as before.
+        user = request.user
+        authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        try:
+            return Request(request, authenticators=authenticators).user.is_staff
+        except exceptions.APIException:
+            return False
+        finally:
+            request.user = user
+
+    def __call__(self, request):
+        forced = self.header in request.META and self.is_staff(request)
+        thread_id = threading.current_thread().ident
+        samples = self.sampler.start(thread_id)
+        profiler = cProfile.Profile() if forced else None
+        started = timezone.now()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            duration = (time.perf_counter() - start) * 1000
+            samples = self.sampler.stop(thread_id)
+            if forced or duration >= self.threshold:
+                self.store(request, response, started, duration, samples, profiler)
+
+    def store(self, request, response, started, duration, samples, profiler):
+        report = None
+        if profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+            report = stream.getvalue()
+        _profiles.append({
+            'id': next(_profile_ids),
+            'pid': os.getpid(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code if response is not None else None,
+            'duration_ms': round(duration, 1),
+            'started': started,
+            'forced': profiler is not None,
+            'samples': sum(samples.values()),
+            'collapsed': '\n'.join('%s %d' % item for item in samples.most_common()),
+            'cprofile': report,
+        })
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Errors like 404 arrive as {'detail': ...}.
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        if not isinstance(data, str):
+            data = str(data)
+        return data.encode(self.charset)
+
+
+def get_profile(pk):
+    for profile in list(_profiles):
+        if profile['id'] == int(pk):
+            return profile
+    raise Http404
+
+
+def summarize(profile, request):
+    summary = OrderedDict((key, profile[key]) for key in (
+        'id', 'pid', 'method', 'path', 'status', 'duration_ms', 'started', 'forced', 'samples'))
+    summary['url'] = reverse('profile-detail', args=[profile['id']], request=request)
+    # Not REST framework's reverse(), it would carry a ?format=json over to the plain text endpoint.
+    summary['collapsed'] = request.build_absolute_uri(django_reverse('profile-collapsed', args=[profile['id']]))
+    return summary
+
+
+class ProfileList(APIView):
+    # Only the profiles of the worker answering the request, see the top of this file.
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response([summarize(profile, request) for profile in reversed(list(_profiles))])
+
+
+class ProfileDetail(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, pk, format=None):
+        profile = get_profile(pk)
+        data = summarize(profile, request)
+        data['cprofile'] = profile['cprofile']
+        return Response(data)
+
+
+class ProfileCollapsed(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request, pk, format=None):
+        return Response(get_profile(pk)['collapsed'])
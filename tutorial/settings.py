@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
+import importlib.util
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -48,8 +49,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tutorial.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tutorial.db.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'tutorial.urls'
@@ -76,13 +79,52 @@ WSGI_APPLICATION = 'tutorial.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
+# 'default' is the primary and takes every write. Reads of snippets and users are spread over the replicas by
+# tutorial.db.PrimaryReplicaRouter. Locally the replicas are plain SQLite files (db.replica1.sqlite3, ...) which
+# are refreshed from the primary with `python manage.py sync_replicas`. Set TUTORIAL_DB_REPLICAS=2 to enable two.
+# CONN_MAX_AGE keeps connections open between requests instead of reconnecting every time.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
+DATABASE_REPLICAS = []
+for i in range(1, int(os.environ.get('TUTORIAL_DB_REPLICAS', 0)) + 1):
+    alias = 'replica%d' % i
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.%s.sqlite3' % alias),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        # The test runner doesn't create separate replica databases, they read the test primary.
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['tutorial.db.PrimaryReplicaRouter']
+
+# How long a client keeps reading from the primary after one of its writes.
+REPLICA_PIN_SECONDS = 5
+
+# Applied to every new SQLite connection, see tutorial.db.configure_sqlite.
+SQLITE_PRAGMAS = [
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'temp_store=MEMORY',
+    'cache_size=-16000',
+    'mmap_size=134217728',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -122,9 +164,68 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Counter store of the snippets.throttling token buckets. Local memory is per process, set
+# TUTORIAL_THROTTLE_CACHE=file to share the buckets between all the workers of the machine.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+if os.environ.get('TUTORIAL_THROTTLE_CACHE') == 'file':
+    CACHES['throttle'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.throttle_cache'),
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAdminUser',
     ],
-    'PAGE_SIZE': 10
-}
\ No newline at end of file
+    'PAGE_SIZE': 10,
+    'DEFAULT_METADATA_CLASS': 'snippets.metadata.CachedMetadata',
+    # Besides JSON and the browsable API, bulk consumers can ask for columnar JSON (keys once, rows as arrays) and
+    # MessagePack, through the Accept header or a .columnar/.msgpack suffix. See snippets/renderers.py.
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'snippets.renderers.ColumnarJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'snippets.parsers.ColumnarJSONParser',
+    ],
+    # Bucket sizes of snippets.throttling. Snippet writes are charged one token plus one per 1000 characters of code.
+    'DEFAULT_THROTTLE_RATES': {
+        'snippet_reads': '600/min',
+        'snippet_writes': '60/min',
+        'users': '300/min',
+    },
+}
+# MessagePack is optional, it's only offered when the msgpack package is installed.
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('snippets.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('snippets.parsers.MessagePackParser')
+
+# Sampled profiling of slow requests, see tutorial/profiling.py. Off unless TUTORIAL_PROFILING=1.
+PROFILING = {
+    'ENABLED': os.environ.get('TUTORIAL_PROFILING') == '1',
+    # Requests slower than this keep their stack samples.
+    'THRESHOLD_MS': 500,
+    'SAMPLE_INTERVAL_MS': 5,
+    # Size of the ring buffer of profiles, per worker process.
+    'KEEP': 20,
+    # Staff users can profile any request by sending X-Profile.
+    'HEADER': 'HTTP_X_PROFILE',
+}
+
+# Lexers and styles tutorial.preload loads before the WSGI workers fork. Others load on first use.
+PRELOAD = {
+    'LEXERS': ['python', 'js', 'html', 'css', 'json', 'bash', 'sql', 'c', 'cpp', 'java'],
+    'STYLES': ['friendly', 'default', 'monokai'],
+}
@@ -0,0 +1,118 @@
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from snippets.models import Snippet
+from tutorial import db
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = db.PrimaryReplicaRouter()
+        db.unpin()
+        self.addCleanup(db.unpin)
+
+    def test_replicated_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(Snippet), 'replica1')
+        self.assertEqual(self.router.db_for_read(User), 'replica1')
+
+    def test_other_apps_read_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_reads_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Snippet), 'default')
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Snippet), 'default')
+
+    def test_pinned_reads_go_to_the_primary(self):
+        db.pin_to_primary()
+        self.assertEqual(self.router.db_for_read(Snippet), 'default')
+        db.unpin()
+        self.assertEqual(self.router.db_for_read(Snippet), 'replica1')
+
+    def test_write_outside_a_request_does_not_pin(self):
+        self.router.db_for_write(Snippet)
+        self.assertFalse(db.has_written())
+        self.assertEqual(self.router.db_for_read(Snippet), 'replica1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class PrimaryPinningMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = db.PrimaryReplicaRouter()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(db.unpin)
+
+    def respond(self, request, write=False):
+        # Runs the middleware around a view that reports where a snippet read would go.
+        seen = {}
+
+        def view(request):
+            seen['read'] = self.router.db_for_read(Snippet)
+            if write:
+                self.router.db_for_write(Snippet)
+                seen['after_write'] = self.router.db_for_read(Snippet)
+            return HttpResponse()
+
+        response = db.PrimaryPinningMiddleware(view)(request)
+        return response, seen
+
+    def test_safe_request_reads_a_replica(self):
+        response, seen = self.respond(self.factory.get('/snippets/'))
+        self.assertEqual(seen['read'], 'replica1')
+        self.assertNotIn(db.PIN_COOKIE_NAME, response.cookies)
+
+    def test_unsafe_requests_read_the_primary_before_writing(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            response, seen = self.respond(getattr(self.factory, method)('/snippets/1/'))
+            self.assertEqual(seen['read'], 'default', method)
+
+    def test_write_pins_the_rest_of_the_request_and_sets_the_cookie(self):
+        response, seen = self.respond(self.factory.get('/snippets/'), write=True)
+        self.assertEqual(seen['read'], 'replica1')
+        self.assertEqual(seen['after_write'], 'default')
+        self.assertEqual(response.cookies[db.PIN_COOKIE_NAME]['max-age'], 5)
+
+    def test_pin_cookie_pins_the_next_request(self):
+        response, _ = self.respond(self.factory.post('/snippets/'), write=True)
+        request = self.factory.get('/snippets/')
+        request.COOKIES[db.PIN_COOKIE_NAME] = response.cookies[db.PIN_COOKIE_NAME].value
+        _, seen = self.respond(request)
+        self.assertEqual(seen['read'], 'default')
+
+    def test_expired_or_broken_cookie_does_not_pin(self):
+        for value in ('0', 'garbage'):
+            request = self.factory.get('/snippets/')
+            request.COOKIES[db.PIN_COOKIE_NAME] = value
+            _, seen = self.respond(request)
+            self.assertEqual(seen['read'], 'replica1', value)
+
+    def test_write_pins_the_user_without_cookies(self):
+        user = User(pk=7, username='api')
+        request = self.factory.post('/snippets/')
+        request.user = user
+        self.respond(request, write=True)
+
+        request = self.factory.get('/snippets/')
+        request.user = user
+        _, seen = self.respond(request)
+        self.assertEqual(seen['read'], 'default')
+
+        request = self.factory.get('/snippets/')
+        request.user = User(pk=8, username='other')
+        _, seen = self.respond(request)
+        self.assertEqual(seen['read'], 'replica1')
+
+    def test_state_is_cleared_after_the_request(self):
+        self.respond(self.factory.post('/snippets/'), write=True)
+        self.assertFalse(db.is_pinned())
+        self.assertEqual(self.router.db_for_read(Snippet), 'replica1')
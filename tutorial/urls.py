@@ -16,23 +16,36 @@ Including another URLconf
 from django.contrib import admin
 from django.conf.urls import url, include
 from rest_framework import routers
+from rest_framework.urlpatterns import format_suffix_patterns
 from quickstart import views
 from snippets.views import  api_root
+from tutorial import profiling
 
 
-router = routers.DefaultRouter()
+# A DefaultRouter would also add its own API root view, which is shadowed by api_root below anyway.
+# SimpleRouter leaves it out, so we only add the format suffixes ourselves.
+router = routers.SimpleRouter()
 router.register(r'users', views.UserViewSet)
 router.register(r'groups', views.GroupViewSet)
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
+# The snippet routes get the most traffic, so they come first, see snippets/urls.py.
 urlpatterns = [
     # There isn't any problem to include multiple URLs on empty regex.
-    url(r'^$', api_root),
-    url(r'^', include(router.urls)),
     url(r'^', include('snippets.urls')),
+    url(r'^', include(format_suffix_patterns(router.urls))),
 
     # This is very conviniet. We include the login URLs for the browsable API.
     url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^admin/', admin.site.urls),
+    # Profiles of slow requests, admins only.
+    url(r'^profiles/$', profiling.ProfileList.as_view(), name='profile-list'),
+    url(r'^profiles/(?P<pk>[0-9]+)/$', profiling.ProfileDetail.as_view(), name='profile-detail'),
+    url(r'^profiles/(?P<pk>[0-9]+)/collapsed/$', profiling.ProfileCollapsed.as_view(), name='profile-collapsed'),
 ]
+# The API root is requested rarely, it can wait at the end of the list.
+urlpatterns += format_suffix_patterns([
+    url(r'^$', api_root),
+])
+
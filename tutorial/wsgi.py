@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tutorial.settings")
 
 application = get_wsgi_application()
+
+# Warm up the app before the workers are forked, see tutorial/preload.py. Only worth it when the server imports this
+# module once in a master process and forks afterwards, e.g. TUTORIAL_PRELOAD=1 gunicorn --preload tutorial.wsgi.
+# Off by default, runserver imports this module too and would pay for it on every reload.
+if os.environ.get('TUTORIAL_PRELOAD') == '1':
+    from tutorial.preload import preload
+    preload()